@@ -0,0 +1,61 @@
+"""Throughput benchmark for the public read endpoints.
+
+Usage: python benchmark_public_pages.py [BASE_URL] [REQUESTS_PER_ENDPOINT] [CONCURRENCY]
+
+Run it against a server started with the query cache enabled, then again with
+QUERY_CACHE_TTL=0 (every lookup misses) to compare. Set ADMIN_EMAIL/ADMIN_PASSWORD
+to also print the cache hit rates from /api/admin/cache/stats.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import os
+import sys
+import time
+
+import requests
+
+BASE_URL = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8001"
+REQUESTS_PER_ENDPOINT = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+CONCURRENCY = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+ENDPOINTS = [
+    "/api/reviews",
+    "/api/reviews/stats",
+    "/api/media",
+    "/api/media/categories",
+    f"/api/time-slots/available?date={date.today().isoformat()}",
+]
+
+def benchmark(session, path):
+    def fetch(_):
+        started = time.perf_counter()
+        response = session.get(f"{BASE_URL}{path}")
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        latencies = sorted(pool.map(fetch, range(REQUESTS_PER_ENDPOINT)))
+    elapsed = time.perf_counter() - started
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    print(f"{path:<50} {REQUESTS_PER_ENDPOINT / elapsed:>8.1f} req/s  p50 {p50:>7.2f} ms  p95 {p95:>7.2f} ms")
+
+def print_cache_stats(session):
+    email = os.getenv("ADMIN_EMAIL")
+    password = os.getenv("ADMIN_PASSWORD")
+    if not email or not password:
+        return
+    token = session.post(f"{BASE_URL}/api/auth/login", json={"email": email, "password": password}).json()["access_token"]
+    stats = session.get(f"{BASE_URL}/api/admin/cache/stats", headers={"Authorization": f"Bearer {token}"}).json()
+    print(f"\nQuery cache ({stats['backend']}, ttl {stats['ttl']}s)")
+    for collection, counts in stats["collections"].items():
+        print(f"  {collection:<12} hit rate {counts['hit_rate']:.1%}  hits {counts['hits']}  misses {counts['misses']}  invalidations {counts['invalidations']}")
+
+if __name__ == "__main__":
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=CONCURRENCY))
+    print(f"{REQUESTS_PER_ENDPOINT} requests per endpoint, concurrency {CONCURRENCY}, against {BASE_URL}\n")
+    for path in ENDPOINTS:
+        benchmark(session, path)
+    print_cache_stats(session)
@@ -1,27 +1,55 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.staticfiles import StaticFiles
-from pymongo import MongoClient
+from fastapi.responses import FileResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
+from pymongo import MongoClient, UpdateOne
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from pydantic import BaseModel, Field
 from typing import Optional, List
+from contextlib import asynccontextmanager
+from collections import Counter, OrderedDict, deque
+import asyncio
+import json
 import os
+import random
+import sys
+import threading
+import time
+import traceback
 import uuid
+import hashlib
 from pathlib import Path
 
 # Configuration
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/am_beauty")
 JWT_SECRET = os.getenv("JWT_SECRET", "your-super-secret-jwt-key-change-in-production")
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))  # seconds
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0"))  # seconds, 0 (default) disables the monitor; keep above a bcrypt login (~0.3 s)
+STATS_DIRTY_CLOCK_SKEW = timedelta(seconds=5)  # overlap when reading other workers' dirty dates
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "512"))  # entries, in-process backend
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "300"))  # seconds, bounds staleness across workers
+QUERY_CACHE_REDIS_URL = os.getenv("QUERY_CACHE_REDIS_URL", "")  # optional shared backend
+BOOKING_WINDOW_DAYS = int(os.getenv("BOOKING_WINDOW_DAYS", "365"))  # available slots cached up to this many days ahead
 
 # Create uploads directory
 Path(UPLOAD_DIR).mkdir(exist_ok=True)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lag_monitor = start_loop_lag_monitor(asyncio.get_running_loop()) if LOOP_LAG_THRESHOLD > 0 else None
+    yield
+    if lag_monitor:
+        beat_task, stop_watchdog = lag_monitor
+        stop_watchdog.set()
+        beat_task.cancel()
+
 # Initialize FastAPI
-app = FastAPI(title="AM.BEAUTYY2 API", version="1.0.0")
+app = FastAPI(title="AM.BEAUTYY2 API", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -33,6 +61,7 @@ app.add_middleware(
 )
 
 # Database connection (fallback to in-memory storage if MongoDB is not available)
+IN_MEMORY_DB = False
 try:
     # Configuration spécifique pour MongoDB Atlas
     client = MongoClient(
@@ -49,6 +78,7 @@ try:
     print("✅ Connected to MongoDB Atlas successfully!")
 except Exception as e:
     print(f"MongoDB not available, using in-memory storage: {e}")
+    IN_MEMORY_DB = True
     # Simple in-memory storage as fallback
     class InMemoryDB:
         def __init__(self):
@@ -69,11 +99,20 @@ except Exception as e:
         def __init__(self, data):
             self.data = data
         
+        def _matches(self, item, query):
+            for k, v in query.items():
+                if isinstance(v, dict) and '$in' in v:
+                    if item.get(k) not in v['$in']:
+                        return False
+                elif item.get(k) != v:
+                    return False
+            return True
+        
         def find_one(self, query=None):
             if not query:
                 return self.data[0] if self.data else None
             for item in self.data:
-                if all(item.get(k) == v for k, v in query.items()):
+                if self._matches(item, query):
                     return item
             return None
         
@@ -82,7 +121,7 @@ except Exception as e:
                 return InMemoryCursor(self.data[:])
             results = []
             for item in self.data:
-                if all(item.get(k) == v for k, v in query.items()):
+                if self._matches(item, query):
                     results.append(item)
             return InMemoryCursor(results)
         
@@ -92,7 +131,7 @@ except Exception as e:
         
         def update_one(self, query, update):
             for item in self.data:
-                if all(item.get(k) == v for k, v in query.items()):
+                if self._matches(item, query):
                     if '$set' in update:
                         item.update(update['$set'])
                     return type('UpdateResult', (), {'matched_count': 1})()
@@ -100,7 +139,7 @@ except Exception as e:
         
         def delete_one(self, query):
             for i, item in enumerate(self.data):
-                if all(item.get(k) == v for k, v in query.items()):
+                if self._matches(item, query):
                     del self.data[i]
                     return type('DeleteResult', (), {'deleted_count': 1})()
             return type('DeleteResult', (), {'deleted_count': 0})()
@@ -174,11 +213,16 @@ class BookingCreate(BaseModel):
 class BookingUpdate(BaseModel):
     status: str
 
+class BookingBulkUpdate(BaseModel):
+    booking_ids: List[str]
+    status: str
+
 class MediaItem(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     filename: str
     original_name: str
     category: str = "general"
+    content_hash: Optional[str] = None  # SHA-256 du contenu, partagé par les doublons
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
 
 class TimeSlot(BaseModel):
@@ -221,6 +265,15 @@ class ReviewCreate(BaseModel):
 class ReviewUpdate(BaseModel):
     status: str  # approved, rejected
 
+class ReviewBulkUpdate(BaseModel):
+    review_ids: List[str]
+    status: str  # approved, rejected
+
+class ProfilingConfig(BaseModel):
+    enabled: bool
+    path_prefix: str = "/api"
+    sample_rate: float = 1.0  # Fraction of matching requests to profile; "X-Profile: 1" always selects
+
 # Helper functions
 def verify_password(plain_password, hashed_password):
     password_str = str(plain_password)[:72] if plain_password else ""
@@ -264,6 +317,272 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
+def apply_bulk_updates(collection, updates):
+    """Apply a list of (filter, update) pairs in a single round-trip"""
+    if not updates:
+        return
+    if IN_MEMORY_DB:
+        for query, update in updates:
+            collection.update_one(query, update)
+    else:
+        collection.bulk_write([UpdateOne(query, update) for query, update in updates], ordered=False)
+
+# Admin statistics cache
+# Aggregates are kept per day; slot and booking writes mark only the touched dates as dirty.
+# On Mongo the dates are also upserted into the stats_dirty collection so every worker sees them.
+BOOKING_STATUSES = ["pending", "confirmed", "completed", "cancelled"]
+admin_stats_cache = {"days": None, "dirty": set(), "checked_at": None}
+
+def invalidate_admin_stats(*dates):
+    dates = {date for date in dates if date}
+    if not dates:
+        return
+    if admin_stats_cache["days"] is not None:
+        admin_stats_cache["dirty"].update(dates)
+    if not IN_MEMORY_DB:
+        now = datetime.utcnow()
+        db.stats_dirty.bulk_write(
+            [UpdateOne({"date": date}, {"$set": {"at": now}}, upsert=True) for date in dates],
+            ordered=False
+        )
+
+def _record_slots(days, date, service, total, booked):
+    day = days.setdefault(date, {"slots": {}, "statuses": {}, "hours": {}})
+    counts = day["slots"].setdefault(service, {"total": 0, "booked": 0})
+    counts["total"] += total
+    counts["booked"] += booked
+
+def _record_bookings(days, date, booking_status, hour, count):
+    day = days.setdefault(date, {"slots": {}, "statuses": {}, "hours": {}})
+    day["statuses"][booking_status] = day["statuses"].get(booking_status, 0) + count
+    if booking_status != "cancelled" and hour:
+        day["hours"][hour] = day["hours"].get(hour, 0) + count
+
+def aggregate_day_stats(dates=None):
+    """Compute per-day slot and booking aggregates, for every day or only the given dates"""
+    days = {}
+    if IN_MEMORY_DB:
+        # Fast path: a single pass over the in-memory lists
+        for slot in db.time_slots.data:
+            if dates is None or slot.get("date") in dates:
+                _record_slots(days, slot["date"], slot.get("service", ""), 1, 1 if slot.get("is_booked") else 0)
+        for booking in db.bookings.data:
+            if dates is None or booking.get("date") in dates:
+                _record_bookings(days, booking["date"], booking.get("status", "pending"), booking.get("time", "")[:2], 1)
+        return days
+
+    match = {} if dates is None else {"date": {"$in": list(dates)}}
+    slot_rows = db.time_slots.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"date": "$date", "service": "$service"},
+            "total": {"$sum": 1},
+            "booked": {"$sum": {"$cond": ["$is_booked", 1, 0]}}
+        }}
+    ])
+    for row in slot_rows:
+        _record_slots(days, row["_id"]["date"], row["_id"]["service"], row["total"], row["booked"])
+
+    booking_rows = db.bookings.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"date": "$date", "status": "$status", "hour": {"$substrCP": ["$time", 0, 2]}},
+            "count": {"$sum": 1}
+        }}
+    ])
+    for row in booking_rows:
+        _record_bookings(days, row["_id"]["date"], row["_id"]["status"], row["_id"]["hour"], row["count"])
+    return days
+
+def get_cached_day_stats():
+    # Only the first call of each worker aggregates every day; later calls refresh dirty dates
+    checked_at = datetime.utcnow()
+    if admin_stats_cache["days"] is None:
+        admin_stats_cache["days"] = aggregate_day_stats()
+        admin_stats_cache["dirty"] = set()
+        admin_stats_cache["checked_at"] = checked_at
+        return admin_stats_cache["days"]
+    
+    if not IN_MEMORY_DB:
+        # Pick up dates written by other workers since the last check
+        since = admin_stats_cache["checked_at"] - STATS_DIRTY_CLOCK_SKEW
+        admin_stats_cache["dirty"].update(doc["date"] for doc in db.stats_dirty.find({"at": {"$gte": since}}))
+        admin_stats_cache["checked_at"] = checked_at
+    
+    if admin_stats_cache["dirty"]:
+        dirty = admin_stats_cache["dirty"]
+        admin_stats_cache["dirty"] = set()
+        fresh = aggregate_day_stats(dirty)
+        for date in dirty:
+            if date in fresh:
+                admin_stats_cache["days"][date] = fresh[date]
+            else:
+                admin_stats_cache["days"].pop(date, None)
+    return admin_stats_cache["days"]
+
+# Query cache
+# Public read results keyed by collection + normalized query + sort. Writes pass the documents
+# they touched (before/after, possibly partial) and only the queries those documents could
+# match are dropped; fields missing from a document are treated as matching anything.
+class LRUCacheBackend:
+    def __init__(self, max_entries=QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (value, expires_at, collection)
+        self.index = {}  # collection -> {key: query}
+    
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, collection = entry
+        if expires_at < time.monotonic():
+            self.delete(collection, [key])
+            return None
+        self.entries.move_to_end(key)
+        return value
+    
+    def set(self, collection, key, query, value, ttl):
+        self.entries[key] = (value, time.monotonic() + ttl, collection)
+        self.entries.move_to_end(key)
+        self.index.setdefault(collection, {})[key] = query
+        while len(self.entries) > self.max_entries:
+            old_key, (_, _, old_collection) = self.entries.popitem(last=False)
+            self.index.get(old_collection, {}).pop(old_key, None)
+    
+    def queries(self, collection):
+        return list(self.index.get(collection, {}).items())
+    
+    def delete(self, collection, keys):
+        for key in keys:
+            self.entries.pop(key, None)
+            self.index.get(collection, {}).pop(key, None)
+
+class RedisCacheBackend:
+    # Values are stored as JSON, never pickled: the store is shared and reachable over the network.
+    # Index fields carry their own expiry and are pruned on misses and invalidation scans.
+    def __init__(self, url, max_entries=QUERY_CACHE_SIZE):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+        self.max_entries = max_entries  # per collection index
+    
+    def get(self, key):
+        raw = self.client.get(f"qc:{key}")
+        if raw is None:
+            self.client.hdel(f"qc-index:{key.split(':', 1)[0]}", key)
+            return None
+        return json.loads(raw)
+    
+    def set(self, collection, key, query, value, ttl):
+        index = f"qc-index:{collection}"
+        if self.client.hlen(index) >= self.max_entries:
+            return
+        entry = {"query": query, "expires_at": time.time() + ttl}
+        pipe = self.client.pipeline()
+        pipe.set(f"qc:{key}", json.dumps(jsonable_encoder(value)), ex=ttl)
+        pipe.hset(index, key, json.dumps(jsonable_encoder(entry)))
+        pipe.expire(index, ttl)
+        pipe.execute()
+    
+    def queries(self, collection):
+        index = f"qc-index:{collection}"
+        live = []
+        expired = []
+        for key, raw in self.client.hgetall(index).items():
+            entry = json.loads(raw)
+            if entry["expires_at"] < time.time():
+                expired.append(key)
+            else:
+                live.append((key.decode(), entry["query"]))
+        if expired:
+            self.client.hdel(index, *expired)
+        return live
+    
+    def delete(self, collection, keys):
+        if keys:
+            pipe = self.client.pipeline()
+            pipe.delete(*[f"qc:{key}" for key in keys])
+            pipe.hdel(f"qc-index:{collection}", *keys)
+            pipe.execute()
+
+class QueryCache:
+    def __init__(self, backend, ttl=QUERY_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = {}  # collection -> Counter(hits, misses, invalidations)
+    
+    @staticmethod
+    def make_key(collection, query, sort):
+        return f"{collection}:{json.dumps(query, sort_keys=True, default=str)}:{json.dumps(sort)}"
+    
+    @staticmethod
+    def could_match(query, doc):
+        for field, condition in query.items():
+            if field not in doc:
+                continue
+            if isinstance(condition, dict) and "$in" in condition:
+                if doc[field] not in condition["$in"]:
+                    return False
+            elif doc[field] != condition:
+                return False
+        return True
+    
+    def get(self, collection, query, sort=None):
+        value = self.backend.get(self.make_key(collection, query, sort))
+        self.stats.setdefault(collection, Counter())["hits" if value is not None else "misses"] += 1
+        return value
+    
+    def set(self, collection, query, sort, value):
+        if self.ttl <= 0:
+            return
+        self.backend.set(collection, self.make_key(collection, query, sort), query, value, self.ttl)
+    
+    def invalidate(self, collection, *docs):
+        """Drop cached queries of a collection that any of the given documents could match (all if none given)"""
+        stale = [
+            key for key, query in self.backend.queries(collection)
+            if not docs or any(self.could_match(query, doc) for doc in docs)
+        ]
+        self.backend.delete(collection, stale)
+        self.stats.setdefault(collection, Counter())["invalidations"] += len(stale)
+    
+    def metrics(self):
+        collections = {}
+        for collection, counts in self.stats.items():
+            lookups = counts["hits"] + counts["misses"]
+            collections[collection] = {
+                "hits": counts["hits"],
+                "misses": counts["misses"],
+                "invalidations": counts["invalidations"],
+                "hit_rate": round(counts["hits"] / lookups, 3) if lookups else 0
+            }
+        return {"backend": type(self.backend).__name__, "ttl": self.ttl, "collections": collections}
+
+try:
+    if not QUERY_CACHE_REDIS_URL:
+        raise RuntimeError("QUERY_CACHE_REDIS_URL not set")
+    query_cache = QueryCache(RedisCacheBackend(QUERY_CACHE_REDIS_URL))
+    print("✅ Query cache using shared Redis backend")
+except Exception as e:
+    print(f"Query cache using in-process LRU backend: {e}")
+    query_cache = QueryCache(LRUCacheBackend())
+
+def cached_find(collection, query, sort=None, cacheable=True, cache_empty=True):
+    """find() through the query cache; sort is a (field, direction) pair"""
+    if cacheable:
+        items = query_cache.get(collection, query, sort)
+        if items is not None:
+            return items
+    
+    cursor = getattr(db, collection).find(query)
+    if sort:
+        cursor = cursor.sort(*sort)
+    # Copy the documents so later in-place writes (in-memory engine) can't alter cached results
+    items = [{k: v for k, v in item.items() if k != "_id"} for item in cursor]
+    if cacheable and (items or cache_empty):
+        query_cache.set(collection, query, sort, items)
+    return items
+
 # Initialize admin user when the app starts
 def init_admin_user():
     print("Backend API started successfully")
@@ -279,8 +598,21 @@ def init_admin_user():
         db.users.insert_one(admin.dict())
         print("Admin user created: admin@ambeauty.com / admin123456")
 
-# Call init function after db setup
+def ensure_indexes():
+    if IN_MEMORY_DB:
+        return
+    # Per-day stats refreshes match on date
+    db.time_slots.create_index("date")
+    db.bookings.create_index("date")
+    db.stats_dirty.create_index("date", unique=True)
+    db.stats_dirty.create_index("at")
+    # Media deduplication and blob reference checks
+    db.media.create_index("content_hash")
+    db.media.create_index("filename")
+
+# Call init functions after db setup
 init_admin_user()
+ensure_indexes()
 
 # Authentication routes
 @app.post("/api/auth/register")
@@ -420,6 +752,8 @@ async def create_time_slot(slot_data: TimeSlotCreate, current_user: dict = Depen
     )
     
     db.time_slots.insert_one(time_slot.dict())
+    invalidate_admin_stats(time_slot.date)
+    query_cache.invalidate("time_slots", time_slot.dict())
     return {"message": "Time slot created successfully", "slot_id": time_slot.id}
 
 @app.get("/api/time-slots")
@@ -441,14 +775,20 @@ async def get_available_time_slots(service: Optional[str] = None, date: Optional
     query = {"is_available": True, "is_booked": False}
     if service:
         query["service"] = service  
+    cacheable = True
     if date:
+        # Anonymous input becomes a cache key, so only accept real dates
+        try:
+            day = datetime.strptime(date, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+        # Only dates inside the booking window are cached
+        today = datetime.utcnow().date()
+        cacheable = today - timedelta(days=1) <= day <= today + timedelta(days=BOOKING_WINDOW_DAYS)
         query["date"] = date
     
-    time_slots = list(db.time_slots.find(query).sort("date", 1))
-    # Remove MongoDB _id field
-    for slot in time_slots:
-        slot.pop("_id", None)
-    return time_slots
+    # An unknown service matches no slot: empty service lookups are not cached, so they can't flood the cache
+    return cached_find("time_slots", query, ("date", 1), cacheable=cacheable, cache_empty=not service)
 
 @app.put("/api/time-slots/{slot_id}")
 async def update_time_slot(slot_id: str, slot_update: TimeSlotUpdate, current_user: dict = Depends(get_current_user)):
@@ -463,13 +803,16 @@ async def update_time_slot(slot_id: str, slot_update: TimeSlotUpdate, current_us
     if slot_update.booking_id is not None:
         update_data["booking_id"] = slot_update.booking_id
     
-    result = db.time_slots.update_one(
+    time_slot = db.time_slots.find_one({"id": slot_id})
+    if not time_slot:
+        raise HTTPException(status_code=404, detail="Time slot not found")
+    
+    db.time_slots.update_one(
         {"id": slot_id},
         {"$set": update_data}
     )
-    
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Time slot not found")
+    invalidate_admin_stats(time_slot["date"])
+    query_cache.invalidate("time_slots", {"date": time_slot["date"], "service": time_slot["service"]})
     
     return {"message": "Time slot updated successfully"}
 
@@ -478,11 +821,14 @@ async def delete_time_slot(slot_id: str, current_user: dict = Depends(get_curren
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    result = db.time_slots.delete_one({"id": slot_id})
-    
-    if result.deleted_count == 0:
+    time_slot = db.time_slots.find_one({"id": slot_id})
+    if not time_slot:
         raise HTTPException(status_code=404, detail="Time slot not found")
     
+    db.time_slots.delete_one({"id": slot_id})
+    invalidate_admin_stats(time_slot["date"])
+    query_cache.invalidate("time_slots", {"date": time_slot["date"], "service": time_slot["service"]})
+    
     return {"message": "Time slot deleted successfully"}
 
 # Booking routes
@@ -515,6 +861,8 @@ async def create_booking(booking_data: BookingCreate, current_user: dict = Depen
         {"id": booking_data.time_slot_id},
         {"$set": {"is_booked": True, "booking_id": booking.id}}
     )
+    invalidate_admin_stats(booking.date)
+    query_cache.invalidate("time_slots", {"date": booking.date, "service": booking.service})
     
     return {"message": "Booking created successfully", "booking_id": booking.id}
 
@@ -543,6 +891,44 @@ async def get_all_bookings(current_user: dict = Depends(get_current_user)):
             booking["user_instagram"] = ""
     return bookings
 
+@app.put("/api/bookings/bulk")
+async def bulk_update_bookings(bulk_update: BookingBulkUpdate, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if bulk_update.status not in BOOKING_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Status must be one of: {', '.join(BOOKING_STATUSES)}")
+    
+    booking_ids = list(dict.fromkeys(bulk_update.booking_ids))
+    bookings = {booking["id"]: booking for booking in db.bookings.find({"id": {"$in": booking_ids}})}
+    
+    results = []
+    booking_updates = []
+    slot_updates = []
+    released_slots = []
+    dates = set()
+    for booking_id in booking_ids:
+        booking = bookings.get(booking_id)
+        if not booking:
+            results.append({"id": booking_id, "success": False, "detail": "Booking not found"})
+            continue
+        
+        booking_updates.append(({"id": booking_id}, {"$set": {"status": bulk_update.status}}))
+        # If booking is cancelled, free up the time slot
+        if bulk_update.status == "cancelled":
+            slot_updates.append(({"booking_id": booking_id}, {"$set": {"is_booked": False, "booking_id": None}}))
+            released_slots.append({"date": booking["date"], "service": booking["service"]})
+        dates.add(booking["date"])
+        results.append({"id": booking_id, "success": True, "previous_status": booking.get("status")})
+    
+    apply_bulk_updates(db.bookings, booking_updates)
+    apply_bulk_updates(db.time_slots, slot_updates)
+    invalidate_admin_stats(*dates)
+    if released_slots:
+        query_cache.invalidate("time_slots", *released_slots)
+    
+    return {"updated": len(booking_updates), "results": results}
+
 @app.put("/api/bookings/{booking_id}")
 async def update_booking(booking_id: str, booking_update: BookingUpdate, current_user: dict = Depends(get_current_user)):
     if current_user["role"] != "admin":
@@ -565,9 +951,77 @@ async def update_booking(booking_id: str, booking_update: BookingUpdate, current
             {"booking_id": booking_id},
             {"$set": {"is_booked": False, "booking_id": None}}
         )
+        query_cache.invalidate("time_slots", {"date": booking["date"], "service": booking["service"]})
+    invalidate_admin_stats(booking["date"])
     
     return {"message": "Booking updated successfully"}
 
+# Admin statistics routes
+@app.get("/api/admin/stats")
+async def get_admin_stats(start_date: Optional[str] = None, end_date: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Occupancy and demand statistics for the admin dashboard
+
+    Each worker aggregates every day once, on its first call. After that only the
+    dates listed in stats_dirty since its last check are re-aggregated.
+    """
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    days = get_cached_day_stats()
+    
+    per_day = []
+    per_service = {}
+    funnel = {booking_status: 0 for booking_status in BOOKING_STATUSES}
+    hours = {}
+    for date in sorted(days):
+        if (start_date and date < start_date) or (end_date and date > end_date):
+            continue
+        day = days[date]
+        day_total = sum(counts["total"] for counts in day["slots"].values())
+        day_booked = sum(counts["booked"] for counts in day["slots"].values())
+        if day_total:
+            per_day.append({
+                "date": date,
+                "total_slots": day_total,
+                "booked_slots": day_booked,
+                "utilization": round(100 * day_booked / day_total, 1)
+            })
+        for service, counts in day["slots"].items():
+            service_counts = per_service.setdefault(service, {"total_slots": 0, "booked_slots": 0})
+            service_counts["total_slots"] += counts["total"]
+            service_counts["booked_slots"] += counts["booked"]
+        for booking_status, count in day["statuses"].items():
+            funnel[booking_status] = funnel.get(booking_status, 0) + count
+        for hour, count in day["hours"].items():
+            hours[hour] = hours.get(hour, 0) + count
+    
+    return {
+        "per_day": per_day,
+        "per_service": [
+            {
+                "service": service,
+                "total_slots": counts["total_slots"],
+                "booked_slots": counts["booked_slots"],
+                "utilization": round(100 * counts["booked_slots"] / counts["total_slots"], 1)
+            }
+            for service, counts in sorted(per_service.items())
+            if counts["total_slots"]
+        ],
+        "booking_funnel": {**funnel, "total": sum(funnel.values())},
+        "busiest_hours": [
+            {"hour": hour, "bookings": count}
+            for hour, count in sorted(hours.items(), key=lambda item: (-item[1], item[0]))
+        ]
+    }
+
+@app.get("/api/admin/cache/stats")
+async def get_query_cache_stats(current_user: dict = Depends(get_current_user)):
+    """Hit rate and invalidation counts of the public query cache"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return query_cache.metrics()
+
 # Media routes  
 @app.post("/api/media/upload")
 async def upload_media(file: UploadFile = File(...), category: str = "general", current_user: dict = Depends(get_current_user)):
@@ -581,14 +1035,25 @@ async def upload_media(file: UploadFile = File(...), category: str = "general",
     if file_extension not in allowed_extensions:
         raise HTTPException(status_code=400, detail="Type de fichier non supporté")
     
-    # Generate unique filename
-    filename = f"{str(uuid.uuid4())}.{file_extension}"
-    file_path = Path(UPLOAD_DIR) / filename
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    # Stream the upload to a temporary file while hashing its content
+    temp_path = Path(UPLOAD_DIR) / f".{uuid.uuid4()}.tmp"
+    hasher = hashlib.sha256()
+    try:
+        with open(temp_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                buffer.write(chunk)
+        content_hash = hasher.hexdigest()
+        
+        # Content-addressed storage: identical files share a single blob
+        existing = db.media.find_one({"content_hash": content_hash})
+        if existing and (Path(UPLOAD_DIR) / existing["filename"]).exists():
+            filename = existing["filename"]
+        else:
+            filename = f"{content_hash}.{file_extension}"
+            os.replace(temp_path, Path(UPLOAD_DIR) / filename)
+    finally:
+        temp_path.unlink(missing_ok=True)
     
     # Determine media type
     video_extensions = {'mp4', 'mov', 'avi', 'mkv'}
@@ -598,13 +1063,15 @@ async def upload_media(file: UploadFile = File(...), category: str = "general",
     media_item = MediaItem(
         filename=filename,
         original_name=file.filename,
-        category=category
+        category=category,
+        content_hash=content_hash
     )
     # Add media type to the dict
     media_dict = media_item.dict()
     media_dict["media_type"] = media_type
     
     db.media.insert_one(media_dict)
+    query_cache.invalidate("media", media_dict)
     
     return {"message": "File uploaded successfully", "filename": filename, "media_type": media_type}
 
@@ -614,11 +1081,7 @@ async def get_media(category: Optional[str] = None):
     if category:
         query["category"] = category
     
-    media_items = list(db.media.find(query).sort("uploaded_at", -1))
-    # Remove MongoDB _id field
-    for item in media_items:
-        item.pop("_id", None)
-    return media_items
+    return cached_find("media", query, ("uploaded_at", -1))
 
 @app.get("/api/media/categories")
 async def get_media_categories():
@@ -626,8 +1089,40 @@ async def get_media_categories():
     categories = ["french-manucure", "nail-art", "pose-gel", "extensions-cils", "soins-pieds"]
     return {"categories": categories}
 
+@app.delete("/api/media/{media_id}")
+async def delete_media(media_id: str, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    media_item = db.media.find_one({"id": media_id})
+    if not media_item:
+        raise HTTPException(status_code=404, detail="Media not found")
+    
+    db.media.delete_one({"id": media_id})
+    query_cache.invalidate("media", media_item)
+    
+    # Remove the blob once no other media item references it
+    blob_deleted = False
+    if not db.media.find_one({"filename": media_item["filename"]}):
+        (Path(UPLOAD_DIR) / media_item["filename"]).unlink(missing_ok=True)
+        blob_deleted = True
+    
+    return {"message": "Media deleted successfully", "blob_deleted": blob_deleted}
+
 # Serve uploaded files
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+@app.api_route("/uploads/{filename}", methods=["GET", "HEAD"])
+async def serve_upload(filename: str):
+    """Sert un fichier uploadé (gère Range/206 pour la lecture vidéo)"""
+    file_path = Path(UPLOAD_DIR) / filename
+    if Path(filename).name != filename or filename.startswith(".") or not file_path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Hash-named blobs never change, so clients may cache them indefinitely
+    headers = {}
+    stem = filename.split(".")[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return FileResponse(file_path, headers=headers)
 
 # Review routes
 @app.post("/api/reviews")
@@ -661,21 +1156,18 @@ async def create_review(review_data: ReviewCreate, current_user: dict = Depends(
     )
     
     db.reviews.insert_one(review.dict())
+    query_cache.invalidate("reviews", review.dict())
     return {"message": "Avis créé avec succès. Il sera visible après validation par l'équipe.", "review_id": review.id}
 
 @app.get("/api/reviews")
 async def get_approved_reviews():
     """Récupère tous les avis approuvés pour affichage public"""
-    reviews = list(db.reviews.find({"status": "approved"}).sort("approved_at", -1))
-    # Remove MongoDB _id field
-    for review in reviews:
-        review.pop("_id", None)
-    return reviews
+    return cached_find("reviews", {"status": "approved"}, ("approved_at", -1))
 
 @app.get("/api/reviews/stats")
 async def get_review_stats():
     """Statistiques des avis approuvés"""
-    approved_reviews = list(db.reviews.find({"status": "approved"}))
+    approved_reviews = cached_find("reviews", {"status": "approved"})
     
     if not approved_reviews:
         return {
@@ -716,6 +1208,39 @@ async def get_pending_reviews(current_user: dict = Depends(get_current_user)):
             review["booking_time"] = booking["time"]
     return reviews
 
+@app.put("/api/reviews/bulk")
+async def bulk_update_review_status(bulk_update: ReviewBulkUpdate, current_user: dict = Depends(get_current_user)):
+    """Approuver ou rejeter plusieurs avis en une fois (admin seulement)"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if bulk_update.status not in ["approved", "rejected"]:
+        raise HTTPException(status_code=400, detail="Status must be 'approved' or 'rejected'")
+    
+    update_data = {"status": bulk_update.status}
+    if bulk_update.status == "approved":
+        update_data["approved_at"] = datetime.utcnow()
+    
+    review_ids = list(dict.fromkeys(bulk_update.review_ids))
+    existing_reviews = {review["id"]: review["status"] for review in db.reviews.find({"id": {"$in": review_ids}})}
+    
+    results = []
+    review_updates = []
+    for review_id in review_ids:
+        if review_id not in existing_reviews:
+            results.append({"id": review_id, "success": False, "detail": "Avis non trouvé"})
+            continue
+        review_updates.append(({"id": review_id}, {"$set": update_data}))
+        results.append({"id": review_id, "success": True})
+    
+    apply_bulk_updates(db.reviews, review_updates)
+    if review_updates:
+        query_cache.invalidate("reviews", {"status": bulk_update.status}, *[
+            {"status": previous_status} for previous_status in set(existing_reviews.values())
+        ])
+    
+    return {"updated": len(review_updates), "results": results}
+
 @app.put("/api/reviews/{review_id}")
 async def update_review_status(review_id: str, review_update: ReviewUpdate, current_user: dict = Depends(get_current_user)):
     """Approuver ou rejeter un avis (admin seulement)"""
@@ -736,6 +1261,8 @@ async def update_review_status(review_id: str, review_update: ReviewUpdate, curr
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Avis non trouvé")
+    # The previous status is not loaded, so drop every cached reviews query
+    query_cache.invalidate("reviews")
     
     action = "approuvé" if review_update.status == "approved" else "rejeté"
     return {"message": f"Avis {action} avec succès"}
@@ -759,6 +1286,216 @@ async def get_my_eligible_bookings(current_user: dict = Depends(get_current_user
     
     return bookings_with_reviews
 
+# Profiling
+# Requests are profiled by sampling the event loop thread's stack from a background thread,
+# so blocking calls (bcrypt, pymongo, JSON encoding) show up in the stacks they block in.
+profiling_state = {
+    "enabled": False,
+    "path_prefix": "/api",
+    "sample_rate": 1.0,
+    "active": False,
+    "profiles": deque(maxlen=50),
+    "handlers": {},  # handler name -> {"requests", "total_ms", "stacks": Counter}
+    "lag_events": deque(maxlen=50)
+}
+
+def folded_stack(frame):
+    """Format a frame and its callers as a collapsed flamegraph stack (root first)"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class StackSampler:
+    """Samples the stack of one thread at a fixed interval until stopped"""
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            # Skip samples where the loop is idle, waiting in the selector
+            if frame is not None and not frame.f_code.co_filename.endswith("selectors.py"):
+                self.stacks[folded_stack(frame)] += 1
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+def should_profile(request: Request):
+    if profiling_state["active"]:
+        return False
+    if not request.url.path.startswith(profiling_state["path_prefix"]):
+        return False
+    if request.url.path.startswith("/api/admin/profiling"):
+        return False
+    return request.headers.get("x-profile") == "1" or random.random() < profiling_state["sample_rate"]
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware: requests pass straight through unless profiling is enabled"""
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiling_state["enabled"] or not should_profile(Request(scope)):
+            await self.app(scope, receive, send)
+            return
+        
+        profile_id = str(uuid.uuid4())
+        response_status = {"code": None}
+        
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                response_status["code"] = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+        
+        # One sampler at a time: concurrent requests share the loop thread and would blur each other
+        profiling_state["active"] = True
+        sampler = StackSampler(threading.get_ident())
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            stacks = sampler.stop()
+            profiling_state["active"] = False
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        
+        # The router stores the matched route in the shared scope; raw paths would give unbounded keys
+        route = scope.get("route")
+        handler = route.path if route else "<unmatched>"
+        profile = {
+            "id": profile_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "handler": handler,
+            "status_code": response_status["code"],
+            "duration_ms": duration_ms,
+            "samples": sum(stacks.values()),
+            "created_at": datetime.utcnow(),
+            "stacks": stacks
+        }
+        profiling_state["profiles"].append(profile)
+        
+        totals = profiling_state["handlers"].setdefault(handler, {"requests": 0, "total_ms": 0.0, "stacks": Counter()})
+        totals["requests"] += 1
+        totals["total_ms"] += duration_ms
+        totals["stacks"].update(stacks)
+
+app.add_middleware(ProfilingMiddleware)
+
+def start_loop_lag_monitor(loop):
+    """Log the event loop's stack whenever it stays blocked longer than LOOP_LAG_THRESHOLD"""
+    loop_thread_id = threading.get_ident()
+    interval = LOOP_LAG_THRESHOLD / 4
+    heartbeat = {"at": time.monotonic()}
+    stop = threading.Event()
+    
+    async def beat():
+        while True:
+            heartbeat["at"] = time.monotonic()
+            await asyncio.sleep(interval)
+    
+    def watchdog():
+        stall = None
+        while not stop.wait(interval):
+            last_beat = heartbeat["at"]
+            if stall is None:
+                # Capture the stack while the blocking call is still running
+                if time.monotonic() - last_beat - interval > LOOP_LAG_THRESHOLD:
+                    frame = sys._current_frames().get(loop_thread_id)
+                    stall = {
+                        "beat": last_beat,
+                        "detected_at": datetime.utcnow(),
+                        "stack": "".join(traceback.format_stack(frame)) if frame else ""
+                    }
+            elif last_beat != stall["beat"]:
+                # The loop is running again: the next heartbeat gives the real stall length
+                lag = last_beat - stall["beat"] - interval
+                profiling_state["lag_events"].append({
+                    "detected_at": stall["detected_at"],
+                    "lag_ms": round(lag * 1000, 2),
+                    "stack": stall["stack"]
+                })
+                print(f"Event loop blocked for {lag * 1000:.0f} ms:\n{stall['stack']}")
+                stall = None
+    
+    threading.Thread(target=watchdog, name="loop-lag-monitor", daemon=True).start()
+    return loop.create_task(beat()), stop
+
+# Profiling routes (admin only)
+@app.get("/api/admin/profiling")
+async def get_profiling_status(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {
+        "enabled": profiling_state["enabled"],
+        "path_prefix": profiling_state["path_prefix"],
+        "sample_rate": profiling_state["sample_rate"],
+        "loop_lag_threshold_ms": LOOP_LAG_THRESHOLD * 1000,
+        "lag_events": list(profiling_state["lag_events"])
+    }
+
+@app.put("/api/admin/profiling")
+async def update_profiling(config: ProfilingConfig, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if config.sample_rate < 0 or config.sample_rate > 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+    
+    profiling_state["enabled"] = config.enabled
+    profiling_state["path_prefix"] = config.path_prefix
+    profiling_state["sample_rate"] = config.sample_rate
+    return {"message": "Profiling settings updated successfully"}
+
+@app.get("/api/admin/profiling/profiles")
+async def get_profiles(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    profiles = [
+        {key: value for key, value in profile.items() if key != "stacks"}
+        for profile in reversed(profiling_state["profiles"])
+    ]
+    return profiles
+
+@app.get("/api/admin/profiling/profiles/{profile_id}")
+async def get_profile(profile_id: str, current_user: dict = Depends(get_current_user)):
+    """Collapsed stacks of one profiled request (flamegraph.pl / speedscope format)"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    for profile in profiling_state["profiles"]:
+        if profile["id"] == profile_id:
+            return PlainTextResponse("\n".join(f"{stack} {count}" for stack, count in profile["stacks"].most_common()))
+    raise HTTPException(status_code=404, detail="Profile not found")
+
+@app.get("/api/admin/profiling/flamegraph")
+async def get_flamegraph(limit: int = 10, current_user: dict = Depends(get_current_user)):
+    """Aggregated collapsed stacks of the most expensive handlers, one root per handler"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    handlers = sorted(profiling_state["handlers"].items(), key=lambda item: item[1]["total_ms"], reverse=True)[:limit]
+    lines = []
+    for handler, totals in handlers:
+        for stack, count in totals["stacks"].most_common():
+            lines.append(f"{handler};{stack} {count}")
+    return PlainTextResponse("\n".join(lines))
+
 # Health check
 @app.get("/api/health")
 async def health_check():
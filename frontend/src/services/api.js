@@ -52,6 +52,7 @@ export const bookingAPI = {
   getMyBookings: () => api.get('/api/bookings/me'),
   getAllBookings: () => api.get('/api/bookings'),
   updateStatus: (bookingId, status) => api.put(`/api/bookings/${bookingId}`, { status }),
+  bulkUpdateStatus: (bookingIds, status) => api.put('/api/bookings/bulk', { booking_ids: bookingIds, status }),
 };
 
 // Media API calls
@@ -60,6 +61,7 @@ export const mediaAPI = {
     headers: { 'Content-Type': 'multipart/form-data' }
   }),
   getAll: () => api.get('/api/media'),
+  delete: (mediaId) => api.delete(`/api/media/${mediaId}`),
 };
 
 // Time Slots API calls
@@ -78,7 +80,13 @@ export const reviewsAPI = {
   getStats: () => api.get('/api/reviews/stats'),
   getPending: () => api.get('/api/reviews/pending'),
   updateStatus: (reviewId, status) => api.put(`/api/reviews/${reviewId}`, { status }),
+  bulkUpdateStatus: (reviewIds, status) => api.put('/api/reviews/bulk', { review_ids: reviewIds, status }),
   getEligibleBookings: () => api.get('/api/reviews/my-eligible-bookings'),
 };
 
+// Admin API calls
+export const adminAPI = {
+  getStats: (params = {}) => api.get('/api/admin/stats', { params }),
+};
+
 export default api;
\ No newline at end of file